@@ -1,287 +1,485 @@
-from flask import Flask, jsonify, request, send_from_directory
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
+from flask import Flask, Response, abort, request, send_file
+from werkzeug.security import safe_join
+from letters import render_sanction_letter
+import hashlib
+import io
+import json
+import logging
+import math
+import multiprocessing
 import os
+import queue
 import sqlite3
-from datetime import datetime
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, the stdlib encoder is used without it
+    orjson = None
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+def _dumps(obj):
+    """Serialize obj to UTF-8 JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _json(obj):
+    """JSON response via _dumps; used instead of jsonify on every endpoint"""
+    return Response(_dumps(obj), mimetype='application/json')
 
-LETTERS_DIR = 'generated_letters'
+LETTERS_DIR = os.path.abspath('generated_letters')
 if not os.path.exists(LETTERS_DIR):
     os.makedirs(LETTERS_DIR)
 
+# Letters are content-addressed and never change once written
+LETTER_MAX_AGE = 31536000
+
+# When set (e.g. '/_letters/'), downloads are handed to nginx via X-Accel-Redirect
+# so the file is sent by the kernel instead of being read through Python
+LETTERS_ACCEL_PREFIX = os.environ.get('LETTERS_ACCEL_PREFIX', '')
+
 # Database setup
 DATABASE = 'customers.db'
+POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 256
+# Largest value an SQLite INTEGER column can hold
+SQLITE_MAX_INT = 2**63 - 1
+
+# WAL lets readers run alongside a writer and, with synchronous=NORMAL,
+# only fsyncs on checkpoint instead of on every commit
+_PRAGMAS = '''
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;
+    PRAGMA mmap_size=134217728;
+'''
+
+# Shared SQL text, so every call hits the per-connection prepared statement cache
+_SQL_GET_CUSTOMER = '''
+    SELECT id, name, phone, address, credit_score, pre_approved_limit, monthly_salary
+    FROM customers WHERE id = ?
+'''
+_SQL_ALL_CUSTOMERS = '''
+    SELECT id, name, phone, address, credit_score, pre_approved_limit, monthly_salary
+    FROM customers ORDER BY id
+'''
+_SQL_INSERT_CUSTOMER = '''
+    INSERT INTO customers (name, phone, address, credit_score, pre_approved_limit, monthly_salary)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+def _connect():
+    """Open a database connection that can be shared across request threads"""
+    conn = sqlite3.connect(
+        DATABASE, check_same_thread=False, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.executescript(_PRAGMAS)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# Connections are opened once at startup and reused by every request. A shared
+# queue is used rather than thread-local connections so the number of open
+# connections stays at POOL_SIZE however many request threads there are, and
+# no connection is left open behind a thread that has exited.
+_POOL = queue.Queue()
+
+@contextmanager
+def get_conn():
+    """Borrow a connection from the pool and hand it back when done"""
+    conn = _POOL.get()
+    try:
+        yield conn
+    finally:
+        _POOL.put(conn)
+
+@contextmanager
+def transaction(conn):
+    """Group statements into one commit (pooled connections are autocommit)"""
+    # IMMEDIATE takes the write lock up front; every transaction here writes
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        conn.execute('COMMIT')
+    finally:
+        # Covers a failed COMMIT too, so the connection never goes back to
+        # the pool still holding the write lock
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
 
 def init_db():
     """Initialize the database and create tables if they don't exist"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS customers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            address TEXT NOT NULL,
-            credit_score INTEGER NOT NULL,
-            pre_approved_limit INTEGER NOT NULL,
-            monthly_salary INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Check if we have any customers, if not, add default ones
-    cursor.execute('SELECT COUNT(*) FROM customers')
-    count = cursor.fetchone()[0]
-    
-    if count == 0:
-        # Insert default customers
-        default_customers = [
-            ("Rajesh Kumar", "+91-9876543210", "123 MG Road, Bangalore, Karnataka - 560001", 750, 500000, 80000),
-            ("Priya Sharma", "+91-9123456789", "456 Park Street, Kolkata, West Bengal - 700016", 650, 200000, 50000),
-            ("Amit Patel", "+91-9988776655", "789 Marine Drive, Mumbai, Maharashtra - 400020", 720, 300000, 120000)
-        ]
+    with get_conn() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS customers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                address TEXT NOT NULL,
+                credit_score INTEGER NOT NULL,
+                pre_approved_limit INTEGER NOT NULL,
+                monthly_salary INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
         
-        cursor.executemany('''
-            INSERT INTO customers (name, phone, address, credit_score, pre_approved_limit, monthly_salary)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', default_customers)
+        # Check if we have any customers, if not, add default ones
+        count = conn.execute('SELECT COUNT(*) FROM customers').fetchone()[0]
         
-        conn.commit()
-    
-    conn.close()
+        if count == 0:
+            # Insert default customers
+            default_customers = [
+                ("Rajesh Kumar", "+91-9876543210", "123 MG Road, Bangalore, Karnataka - 560001", 750, 500000, 80000),
+                ("Priya Sharma", "+91-9123456789", "456 Park Street, Kolkata, West Bengal - 700016", 650, 200000, 50000),
+                ("Amit Patel", "+91-9988776655", "789 Marine Drive, Mumbai, Maharashtra - 400020", 720, 300000, 120000)
+            ]
+            
+            # Load all rows in a single transaction (one commit, not one per row).
+            # Any secondary indexes added later should be created after this
+            # bulk load rather than before it, so they are built in one pass.
+            with transaction(conn):
+                conn.executemany(_SQL_INSERT_CUSTOMER, default_customers)
+
+def _whole_number(value):
+    """Return value as an int if it is a whole number (the form posts them as strings), else None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+def _customer_row(customer_id):
+    """Return the cached customer row, or None for unknown or malformed ids"""
+    # Only whole ids that fit an INTEGER column; 1.9 must not match customer 1
+    customer_id = _whole_number(customer_id)
+    if customer_id is None or not 0 < customer_id <= SQLITE_MAX_INT:
+        return None
+    return _load_customer(customer_id)
+
+@lru_cache(maxsize=1024)
+def _load_customer(customer_id):
+    """Fetch a customer row from database"""
+    with get_conn() as conn:
+        return conn.execute(_SQL_GET_CUSTOMER, (customer_id,)).fetchone()
 
 def get_customer_by_id(customer_id):
-    """Fetch customer data from database"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, name, phone, address, credit_score, pre_approved_limit, monthly_salary
-        FROM customers WHERE id = ?
-    ''', (customer_id,))
-    
-    row = cursor.fetchone()
-    conn.close()
+    """Fetch customer data, served from the in-process cache after the first lookup"""
+    row = _customer_row(customer_id)
     
     if row:
         return {
-            "id": row[0],
-            "name": row[1],
+            "id": row["id"],
+            "name": row["name"],
             "kyc_details": {
-                "phone": row[2],
-                "address": row[3]
+                "phone": row["phone"],
+                "address": row["address"]
             },
-            "credit_score": row[4],
-            "pre_approved_limit": row[5],
-            "monthly_salary": row[6]
+            "credit_score": row["credit_score"],
+            "pre_approved_limit": row["pre_approved_limit"],
+            "monthly_salary": row["monthly_salary"]
         }
     return None
 
+def get_customer_kyc(customer_id):
+    """Return (name, phone, address) for a customer, or None"""
+    row = _customer_row(customer_id)
+    return row[1:4] if row else None
+
+def get_customer_credit(customer_id):
+    """Return (credit_score, pre_approved_limit, monthly_salary) for a customer, or None"""
+    row = _customer_row(customer_id)
+    return row[4:7] if row else None
+
+# The customer list only changes on insert, so it is cached in memory as
+# (version, expires_at, customers). add_customer_to_db bumps the version; the
+# TTL bounds how stale the list can get if another process writes to the DB.
+CUSTOMERS_TTL_SECONDS = 60
+_CUSTOMERS_CACHE = None
+_CUSTOMERS_VERSION = 0
+_CUSTOMERS_LOCK = threading.Lock()
+
+def _customers_cache_fresh(cached):
+    return cached is not None and cached[0] == _CUSTOMERS_VERSION and time.monotonic() < cached[1]
+
 def get_all_customers():
+    """Fetch all customers, served from memory until the next insert or TTL expiry (do not mutate the result)"""
+    global _CUSTOMERS_CACHE
+    cached = _CUSTOMERS_CACHE
+    if _customers_cache_fresh(cached):
+        return cached[2]
+    
+    with _CUSTOMERS_LOCK:
+        # Another request may have reloaded the list while this one waited
+        cached = _CUSTOMERS_CACHE
+        if _customers_cache_fresh(cached):
+            return cached[2]
+        
+        version = _CUSTOMERS_VERSION
+        customers = _query_all_customers()
+        _CUSTOMERS_CACHE = (version, time.monotonic() + CUSTOMERS_TTL_SECONDS, customers)
+        return customers
+
+def _query_all_customers():
     """Fetch all customers from database"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, name, phone, address, credit_score, pre_approved_limit, monthly_salary
-        FROM customers ORDER BY id
-    ''')
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    customers = []
-    for row in rows:
-        customers.append({
-            "id": row[0],
-            "name": row[1],
-            "phone": row[2],
-            "address": row[3],
-            "credit_score": row[4],
-            "pre_approved_limit": row[5],
-            "monthly_salary": row[6]
-        })
-    
-    return customers
+    with get_conn() as conn:
+        return [dict(row) for row in conn.execute(_SQL_ALL_CUSTOMERS)]
+
+# Inserts go through a single writer thread. Whatever has queued up while the
+# previous commit was running (up to WRITE_BATCH_SIZE rows) is written in one
+# transaction, so concurrent sign-ups share a commit instead of paying one each.
+WRITE_BATCH_SIZE = 64
+_WRITE_Q = queue.Queue()
+
+def _insert_customers(batch):
+    """Insert (values, future) pairs in one transaction and resolve each future with its new id"""
+    with get_conn() as conn, transaction(conn):
+        # lastrowid is read straight off the connection, no extra query needed
+        ids = [conn.execute(_SQL_INSERT_CUSTOMER, values).lastrowid for values, _ in batch]
+    for (_, future), customer_id in zip(batch, ids):
+        future.set_result(customer_id)
+
+def _writer_loop():
+    while True:
+        batch = [_WRITE_Q.get()]
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(_WRITE_Q.get_nowait())
+            except queue.Empty:
+                break
+        
+        try:
+            _insert_customers(batch)
+        except Exception:
+            # Retry one by one so a single bad row only fails its own request
+            for item in batch:
+                try:
+                    _insert_customers([item])
+                except Exception as e:
+                    item[1].set_exception(e)
 
 def add_customer_to_db(name, phone, address, credit_score, pre_approved_limit, monthly_salary):
     """Add new customer to database"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+    global _CUSTOMERS_VERSION
+    future = Future()
+    _WRITE_Q.put(((name, phone, address, credit_score, pre_approved_limit, monthly_salary), future))
+    # Wait for the commit, so the id is usable as soon as the caller gets it
+    customer_id = future.result()
     
-    cursor.execute('''
-        INSERT INTO customers (name, phone, address, credit_score, pre_approved_limit, monthly_salary)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (name, phone, address, credit_score, pre_approved_limit, monthly_salary))
-    
-    conn.commit()
-    customer_id = cursor.lastrowid
-    conn.close()
+    # Drop cached lookups, including any "not found" result for this id
+    _load_customer.cache_clear()
+    _CUSTOMERS_VERSION += 1
     
     return customer_id
 
-# Initialize database on startup
-init_db()
-
 def verification_agent(customer_id):
-    customer = get_customer_by_id(customer_id)
+    kyc = get_customer_kyc(customer_id)
     
-    if not customer:
+    if not kyc:
         return {"status": "error", "message": "Customer not found"}
     
+    name, phone, address = kyc
     return {
         "status": "success",
-        "name": customer["name"],
-        "kyc_details": customer["kyc_details"]
+        "name": name,
+        "kyc_details": {"phone": phone, "address": address}
     }
 
+# Underwriting decision messages, formatted only on the branch that returns them
+_REJ_CREDIT = "Credit score ({}) is below the minimum requirement of 700".format
+_REJ_OVER_LIMIT = "Requested loan amount (Rs{:,}) exceeds 2x the pre-approved limit (Rs{:,})".format
+_REJ_EMI = "EMI (Rs{:,.2f}) exceeds 50% of monthly salary (Rs{:,.2f})".format
+_OK_WITHIN_LIMIT = "Loan amount (Rs{:,}) is within pre-approved limit (Rs{:,})".format
+_OK_SALARY = "Salary verification passed. EMI (Rs{:,.2f}) is within 50% of monthly salary (Rs{:,})".format
+
 def underwriting_agent(customer_id, loan_amount, tenure_months=60):
-    customer = get_customer_by_id(customer_id)
+    credit = get_customer_credit(customer_id)
     
-    if not customer:
+    if not credit:
         return {"status": "error", "reason": "Customer not found"}
     
-    credit_score = customer["credit_score"]
-    pre_approved_limit = customer["pre_approved_limit"]
-    monthly_salary = customer["monthly_salary"]
+    credit_score, pre_approved_limit, monthly_salary = credit
     
     if credit_score < 700:
         return {
             "status": "rejected",
-            "reason": f"Credit score ({credit_score}) is below the minimum requirement of 700"
+            "reason": _REJ_CREDIT(credit_score)
         }
     
-    if loan_amount > 2 * pre_approved_limit:
+    max_loan = 2 * pre_approved_limit
+    if loan_amount > max_loan:
         return {
             "status": "rejected",
-            "reason": f"Requested loan amount (Rs{loan_amount:,}) exceeds 2x the pre-approved limit (Rs{2*pre_approved_limit:,})"
+            "reason": _REJ_OVER_LIMIT(loan_amount, max_loan)
         }
     
     if loan_amount <= pre_approved_limit:
+        # EMI is computed here once and reused on the sanction letter
+        rate = 10.5
         return {
             "status": "approved",
-            "reason": f"Loan amount (Rs{loan_amount:,}) is within pre-approved limit (Rs{pre_approved_limit:,})",
-            "interest_rate": 10.5,
-            "tenure_months": tenure_months
+            "reason": _OK_WITHIN_LIMIT(loan_amount, pre_approved_limit),
+            "interest_rate": rate,
+            "tenure_months": tenure_months,
+            "emi": loan_amount * (1 + rate / 100) / tenure_months
         }
     
-    if pre_approved_limit < loan_amount <= 2 * pre_approved_limit:
-        total_amount = loan_amount * 1.12
-        emi = total_amount / tenure_months
-        max_emi = monthly_salary * 0.5
-        
-        if emi <= max_emi:
-            return {
-                "status": "approved",
-                "reason": f"Salary verification passed. EMI (Rs{emi:,.2f}) is within 50% of monthly salary (Rs{monthly_salary:,})",
-                "interest_rate": 12.0,
-                "tenure_months": tenure_months,
-                "emi": emi,
-                "salary_verification_required": True
-            }
-        else:
-            return {
-                "status": "rejected",
-                "reason": f"EMI (Rs{emi:,.2f}) exceeds 50% of monthly salary (Rs{max_emi:,.2f})"
-            }
+    # pre_approved_limit < loan_amount <= max_loan
+    rate = 12.0
+    total_amount = loan_amount * (1 + rate / 100)
+    emi = total_amount / tenure_months
+    max_emi = monthly_salary * 0.5
+    
+    if emi <= max_emi:
+        return {
+            "status": "approved",
+            "reason": _OK_SALARY(emi, monthly_salary),
+            "interest_rate": rate,
+            "tenure_months": tenure_months,
+            "emi": emi,
+            "salary_verification_required": True
+        }
+    else:
+        return {
+            "status": "rejected",
+            "reason": _REJ_EMI(emi, max_emi)
+        }
+
+def letter_key(customer, loan_amount, interest_rate, tenure_months, approval_status, issue_date):
+    """Stable digest of everything printed on a sanction letter"""
+    kyc = customer["kyc_details"]
+    raw = f"{customer['id']}|{customer['name']}|{kyc['phone']}|{kyc['address']}|{loan_amount}|{interest_rate}|{tenure_months}|{approval_status}|{issue_date.isoformat()}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def build_letter_task(customer, loan_amount, interest_rate, tenure_months, approval_status, emi=None):
+    """Collects everything printed on a letter into a plain dict that can be sent to a worker process"""
+    # Filenames are content-addressed, so a repeat request on the same day reuses
+    # the letter on disk; a later reapplication gets a freshly dated letter
+    issue_date = date.today()
+    key = letter_key(customer, loan_amount, interest_rate, tenure_months, approval_status, issue_date)
+    filename = f"Sanction_Letter_{customer['id']}_{key}.pdf"
+    return {
+        "filename": filename,
+        "filepath": os.path.join(LETTERS_DIR, filename),
+        "name": customer["name"],
+        "phone": customer["kyc_details"]["phone"],
+        "address": customer["kyc_details"]["address"],
+        "loan_amount": loan_amount,
+        "interest_rate": interest_rate,
+        "tenure_months": tenure_months,
+        "approval_status": approval_status,
+        "emi": emi,
+        "issue_date": issue_date
+    }
+
+# ReportLab is CPU bound, so batches of letters are rendered across processes.
+# Workers are spawned fresh rather than forked, so they don't inherit locks
+# held by the writer and letter threads; they only need the letters module.
+_PDF_POOL = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+
+# Recently generated letters are kept in memory so /download rarely touches disk
+LETTER_CACHE_SIZE = 64
+_LETTER_CACHE = OrderedDict()
+_LETTER_CACHE_LOCK = threading.Lock()
 
-def sanction_letter_generator(customer_id, loan_amount, interest_rate, tenure_months, approval_status):
-    """Generates a PDF sanction letter using reportlab"""
+def cache_letter(filename, data, mtime):
+    """Keep a letter's bytes and modification time in memory, evicting the least recently used ones"""
+    with _LETTER_CACHE_LOCK:
+        _LETTER_CACHE[filename] = (data, mtime)
+        _LETTER_CACHE.move_to_end(filename)
+        while len(_LETTER_CACHE) > LETTER_CACHE_SIZE:
+            _LETTER_CACHE.popitem(last=False)
+
+def get_cached_letter(filename):
+    """Return a letter's (bytes, mtime) from memory, or None if it is not cached"""
+    with _LETTER_CACHE_LOCK:
+        entry = _LETTER_CACHE.get(filename)
+        if entry is not None:
+            _LETTER_CACHE.move_to_end(filename)
+        return entry
+
+def save_letter(task, data):
+    """Persist a rendered letter so it survives eviction and restarts, then cache it"""
+    # Write to a private temp file then rename, so nobody ever sees a
+    # half-written letter and concurrent renders of one letter don't collide
+    fd, tmp_path = tempfile.mkstemp(dir=LETTERS_DIR, suffix='.tmp')
     try:
-        customer = get_customer_by_id(customer_id)
-        
-        if not customer:
-            print(f"ERROR: Customer {customer_id} not found!")
-            return None
-        
-        # Create filename
-        filename = f"Sanction_Letter_{customer_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        filepath = os.path.join(LETTERS_DIR, filename)
-        
-        print(f"Creating PDF at: {filepath}")
-        
-        # Create PDF
-        c = canvas.Canvas(filepath, pagesize=letter)
-        width, height = letter
-        
-        # Add Tata Capital Header
-        c.setFont("Helvetica-Bold", 20)
-        c.drawString(1*inch, height - 1*inch, "TATA CAPITAL")
-        
-        c.setFont("Helvetica", 10)
-        c.drawString(1*inch, height - 1.3*inch, "Financial Services Limited")
-        c.line(1*inch, height - 1.5*inch, width - 1*inch, height - 1.5*inch)
-        
-        # Title
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(1*inch, height - 2*inch, "LOAN SANCTION LETTER")
-        
-        # Date
-        c.setFont("Helvetica", 11)
-        c.drawString(1*inch, height - 2.5*inch, f"Date: {datetime.now().strftime('%d %B, %Y')}")
-        
-        # Customer Details
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(1*inch, height - 3*inch, "Customer Details:")
-        
-        c.setFont("Helvetica", 11)
-        y_position = height - 3.3*inch
-        c.drawString(1.2*inch, y_position, f"Name: {customer['name']}")
-        y_position -= 0.25*inch
-        c.drawString(1.2*inch, y_position, f"Phone: {customer['kyc_details']['phone']}")
-        y_position -= 0.25*inch
-        c.drawString(1.2*inch, y_position, f"Address: {customer['kyc_details']['address']}")
-        
-        # Loan Details
-        y_position -= 0.5*inch
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(1*inch, y_position, "Loan Details:")
-        
-        y_position -= 0.3*inch
-        c.setFont("Helvetica", 11)
-        c.drawString(1.2*inch, y_position, f"Loan Amount: Rs {loan_amount:,}")
-        y_position -= 0.25*inch
-        c.drawString(1.2*inch, y_position, f"Interest Rate: {interest_rate}% per annum")
-        y_position -= 0.25*inch
-        c.drawString(1.2*inch, y_position, f"Tenure: {tenure_months} months")
-        y_position -= 0.25*inch
-        
-        total_payable = loan_amount * (1 + interest_rate/100)
-        emi = total_payable / tenure_months
-        c.drawString(1.2*inch, y_position, f"Estimated EMI: Rs {emi:,.2f}")
-        
-        # Approval Status
-        y_position -= 0.5*inch
-        c.setFont("Helvetica-Bold", 14)
-        if approval_status == "approved":
-            c.setFillColorRGB(0, 0.5, 0)
-            c.drawString(1*inch, y_position, "STATUS: APPROVED")
-        else:
-            c.setFillColorRGB(0.8, 0, 0)
-            c.drawString(1*inch, y_position, f"STATUS: {approval_status.upper()}")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates the file owner-only; letters may be served by nginx
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, task["filepath"])
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    cache_letter(task["filename"], data, os.stat(task["filepath"]).st_mtime)
+
+# Single letters are rendered by a background thread so /start_simulation can
+# answer without waiting on ReportLab. Each queued filename maps to an Event
+# that is set once the worker has finished with it; filenames whose render
+# failed are remembered until they are queued again, so /download can say so.
+LETTER_WAIT_SECONDS = 10
+_LETTER_Q = queue.Queue()
+_PENDING_LETTERS = {}
+_FAILED_LETTERS = set()
+_PENDING_LOCK = threading.Lock()
+
+def _letter_worker():
+    while True:
+        task = _LETTER_Q.get()
+        try:
+            save_letter(task, render_sanction_letter(task))
+            logger.info("Generated %s", task["filename"])
+        except Exception:
+            logger.exception("Failed to generate %s", task["filename"])
+            with _PENDING_LOCK:
+                _FAILED_LETTERS.add(task["filename"])
+        finally:
+            with _PENDING_LOCK:
+                _PENDING_LETTERS.pop(task["filename"]).set()
+
+def sanction_letter_generator(customer, loan_amount, interest_rate, tenure_months, approval_status, emi=None, background=False):
+    """Generates a PDF sanction letter using reportlab for an already loaded customer dict"""
+    try:
+        task = build_letter_task(customer, loan_amount, interest_rate, tenure_months, approval_status, emi)
+        filename = task["filename"]
         
-        # Footer
-        c.setFillColorRGB(0, 0, 0)
-        c.setFont("Helvetica-Oblique", 9)
-        c.drawString(1*inch, 1*inch, "This is a system-generated letter. No signature is required.")
-        c.drawString(1*inch, 0.75*inch, "For queries, contact: support@tatacapital.com | 1800-123-4567")
+        if os.path.exists(task["filepath"]):
+            logger.debug("Reusing %s", filename)
+            return filename
         
-        # IMPORTANT: Save the PDF
-        c.save()
+        # The filename is deterministic, so it can be handed out before the PDF exists
+        if background:
+            with _PENDING_LOCK:
+                if filename not in _PENDING_LETTERS:
+                    _FAILED_LETTERS.discard(filename)
+                    _PENDING_LETTERS[filename] = threading.Event()
+                    _LETTER_Q.put(task)
+            return filename
         
-        print(f"PDF created successfully: {filename}")
-        print(f"File exists: {os.path.exists(filepath)}")
+        save_letter(task, render_sanction_letter(task))
+        logger.info("Generated %s", filename)
         
         return filename
         
-    except Exception as e:
-        print(f"ERROR generating PDF: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Failed to generate sanction letter")
         return None
 
 HTML_TEMPLATE = '''
@@ -551,24 +749,32 @@ HTML_TEMPLATE = '''
         </div>
     </div>
 
+    <script>window.__CUSTOMERS__ = __CUSTOMERS_JSON__;</script>
     <script>
         const startButton = document.getElementById('start-btn');
         const customerSelect = document.getElementById('customer-select');
         const loanAmountInput = document.getElementById('loan-amount');
         const chatWindow = document.getElementById('chat-window');
 
+        function renderCustomers(customers) {
+            customerSelect.innerHTML = '<option value="">-- Choose a Customer --</option>';
+            customers.forEach(customer => {
+                const option = document.createElement('option');
+                option.value = customer.id;
+                option.textContent = `Customer ${customer.id}: ${customer.name} (Credit: ${customer.credit_score}, Limit: ₹${(customer.pre_approved_limit/100000).toFixed(1)}L)`;
+                customerSelect.appendChild(option);
+            });
+        }
+
         function loadCustomers() {
+            // The server inlines the list into the page; only fetch it if that is missing
+            if (window.__CUSTOMERS__) {
+                renderCustomers(window.__CUSTOMERS__);
+                return;
+            }
             fetch('/get_customers')
             .then(response => response.json())
-            .then(customers => {
-                customerSelect.innerHTML = '<option value="">-- Choose a Customer --</option>';
-                customers.forEach(customer => {
-                    const option = document.createElement('option');
-                    option.value = customer.id;
-                    option.textContent = `Customer ${customer.id}: ${customer.name} (Credit: ${customer.credit_score}, Limit: ₹${(customer.pre_approved_limit/100000).toFixed(1)}L)`;
-                    customerSelect.appendChild(option);
-                });
-            });
+            .then(renderCustomers);
         }
 
         loadCustomers();
@@ -692,7 +898,7 @@ HTML_TEMPLATE = '''
                     document.getElementById('customer-form').classList.add('hidden');
                     document.getElementById('toggle-form-btn').textContent = 'Show Form';
                 } else {
-                    status.textContent = 'Error adding customer';
+                    status.textContent = data.message || 'Error adding customer';
                     status.className = 'status-message error';
                 }
                 setTimeout(() => status.className = 'status-message', 5000);
@@ -712,9 +918,30 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+# Encode the page once; only the inlined customer list changes between requests
+HTML_HEAD, HTML_TAIL = HTML_TEMPLATE.encode('utf-8').split(b'__CUSTOMERS_JSON__')
+
+# (customer list, page bytes, etag) for the last rendered index page; it is
+# rebuilt whenever get_all_customers hands back a different list object
+_INDEX_CACHE = None
+
 @app.route('/')
 def index():
-    return HTML_TEMPLATE
+    global _INDEX_CACHE
+    customers = get_all_customers()
+    cached = _INDEX_CACHE
+    if cached is None or cached[0] is not customers:
+        # Escape '<' so a customer name can never close the inline <script>
+        customers_json = _dumps(customers).replace(b'<', b'\\u003c')
+        body = HTML_HEAD + customers_json + HTML_TAIL
+        cached = _INDEX_CACHE = (customers, body, hashlib.md5(body).hexdigest())
+    _, body, etag = cached
+    
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    # The list changes when customers are added, so always revalidate
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/start_simulation', methods=['POST'])
 def start_simulation():
@@ -733,7 +960,7 @@ def start_simulation():
     
     if verification_result["status"] == "error":
         log.append(f"❌ Verification Agent: {verification_result['message']}")
-        return jsonify({"log": log})
+        return _json({"log": log})
     
     log.append(f"✅ Verification Agent: KYC verification successful!")
     log.append(f"📋 Verification Agent: Customer Name - {verification_result['name']}")
@@ -764,64 +991,232 @@ def start_simulation():
         log.append("📝 Master Agent: Generating sanction letter...")
         
         filename = sanction_letter_generator(
-            customer_id,
+            customer,
             loan_amount,
             underwriting_result["interest_rate"],
             underwriting_result["tenure_months"],
-            "approved"
+            "approved",
+            emi=underwriting_result["emi"],
+            background=True
         )
         
         if filename:
-            log.append(f"✅ Sanction Letter Agent: PDF generated successfully!")
+            log.append(f"⏳ Sanction Letter Agent: Your sanction letter is being prepared. The link below will download it once it is ready.")
             log.append(f"📄 Sanction Letter Agent: <a href='/download/{filename}' target='_blank' class='pdf-link'>Download Your Sanction Letter</a>")
             log.append("---")
             log.append("🤖 Master Agent: Congratulations! Your loan has been approved. Please download your sanction letter above.")
         else:
             log.append(f"❌ Sanction Letter Agent: Error generating PDF. Please contact support.")
     
-    return jsonify({"log": log})
+    return _json({"log": log})
+
+def _letter_response(filename, data, mtime):
+    """Attachment response for a letter's bytes (conditional and range requests included)"""
+    response = send_file(
+        io.BytesIO(data), mimetype='application/pdf', as_attachment=True, download_name=filename,
+        conditional=True, etag=filename, last_modified=mtime, max_age=LETTER_MAX_AGE
+    )
+    response.cache_control.immutable = True
+    return response
 
-@app.route('/download/<filename>')
+@app.route('/download/<path:filename>')
 def download_file(filename):
     """Serve the generated PDF files"""
+    # Letters queued by /start_simulation may still be rendering
+    pending = _PENDING_LETTERS.get(filename)
+    if pending and not pending.wait(LETTER_WAIT_SECONDS):
+        response = _json({"status": "error", "message": "Your sanction letter is still being prepared. Please try again shortly."})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(LETTER_WAIT_SECONDS)
+        return response
+    
+    if filename in _FAILED_LETTERS:
+        return _json({"status": "error", "message": "Your sanction letter could not be generated. Please run the simulation again or contact support."}), 500
+    
+    cached = get_cached_letter(filename)
+    if cached is not None:
+        return _letter_response(filename, *cached)
+    
+    path = safe_join(LETTERS_DIR, filename)
+    if path is None:
+        abort(404)
+    
+    if LETTERS_ACCEL_PREFIX:
+        response = Response(mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = LETTERS_ACCEL_PREFIX + filename
+        response.headers.set('Content-Disposition', 'attachment', filename=filename)
+        response.cache_control.public = True
+        response.cache_control.max_age = LETTER_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+    
+    # Not in memory (evicted, or generated before a restart): load it once from
+    # disk and keep it, so repeat downloads of the same letter skip the filesystem
+    logger.debug("Loading %s from %s", filename, LETTERS_DIR)
     try:
-        # Get absolute path
-        abs_path = os.path.abspath(LETTERS_DIR)
-        print(f"Looking for file in: {abs_path}")
-        print(f"Filename requested: {filename}")
-        print(f"Full path: {os.path.join(abs_path, filename)}")
-        print(f"File exists: {os.path.exists(os.path.join(abs_path, filename))}")
+        with open(path, 'rb') as f:
+            data = f.read()
+            mtime = os.fstat(f.fileno()).st_mtime
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        abort(404)
+    
+    cache_letter(filename, data, mtime)
+    return _letter_response(filename, data, mtime)
+
+MAX_BATCH_SIZE = 50
+
+def parse_batch(data):
+    """Validate a /download_batch body; returns ([(customer_id, loan_amount)], None) or (None, error message)"""
+    if not isinstance(data, dict):
+        return None, "Request body must be a JSON object"
+    
+    applications = data.get('applications')
+    if not isinstance(applications, list):
+        return None, "applications must be a list"
+    if len(applications) > MAX_BATCH_SIZE:
+        return None, f"At most {MAX_BATCH_SIZE} applications per batch"
+    
+    parsed = []
+    for application in applications:
+        if not isinstance(application, dict):
+            return None, "Each application must be a JSON object"
+        customer_id = application.get('customer_id')
+        if not isinstance(customer_id, int) or isinstance(customer_id, bool) \
+                or not 0 < customer_id <= SQLITE_MAX_INT:
+            return None, "customer_id must be a positive whole number"
+        loan_amount = application.get('loan_amount')
+        if not isinstance(loan_amount, (int, float)) or isinstance(loan_amount, bool) \
+                or not math.isfinite(loan_amount) or loan_amount <= 0:
+            return None, "loan_amount must be a positive number"
+        parsed.append((customer_id, float(loan_amount)))
+    
+    return parsed, None
+
+@app.route('/download_batch', methods=['POST'])
+def download_batch():
+    """Underwrite several applications and render the approved letters in parallel"""
+    applications, error = parse_batch(request.get_json(silent=True))
+    if error:
+        return _json({"status": "error", "message": error}), 400
+    
+    letters = []
+    pending = {}
+    for customer_id, loan_amount in applications:
+        underwriting_result = underwriting_agent(customer_id, loan_amount)
         
-        return send_from_directory(abs_path, filename, as_attachment=True)
-    except Exception as e:
-        print(f"Download error: {str(e)}")
-        return jsonify({"error": str(e)}), 404
+        result = {"customer_id": customer_id, "status": underwriting_result["status"]}
+        if underwriting_result["status"] == "approved":
+            task = build_letter_task(
+                get_customer_by_id(customer_id),
+                loan_amount,
+                underwriting_result["interest_rate"],
+                underwriting_result["tenure_months"],
+                "approved",
+                underwriting_result["emi"]
+            )
+            # Letters the background worker is already rendering are left to it
+            if task["filename"] not in _PENDING_LETTERS and not os.path.exists(task["filepath"]):
+                pending.setdefault(task["filename"], (task, []))[1].append(result)
+            result["download_url"] = f"/download/{task['filename']}"
+        else:
+            result["reason"] = underwriting_result["reason"]
+        letters.append(result)
+    
+    futures = [(_PDF_POOL.submit(render_sanction_letter, task), task, results) for task, results in pending.values()]
+    for future, task, results in futures:
+        # One bad render only fails the applications that share its letter
+        try:
+            save_letter(task, future.result())
+        except Exception:
+            logger.exception("Failed to generate %s", task["filename"])
+            for result in results:
+                del result["download_url"]
+                result["status"] = "error"
+                result["reason"] = "Error generating sanction letter"
+    
+    return _json({"letters": letters})
 
+# (customer list, encoded body, etag) for the last /get_customers response
+_CUSTOMERS_BODY = None
 
 @app.route('/get_customers')
 def get_customers():
     """Return all customers from database"""
+    global _CUSTOMERS_BODY
     customers = get_all_customers()
-    return jsonify(customers)
+    cached = _CUSTOMERS_BODY
+    if cached is None or cached[0] is not customers:
+        body = _dumps(customers)
+        cached = _CUSTOMERS_BODY = (customers, body, hashlib.blake2b(body, digest_size=16).hexdigest())
+    _, body, etag = cached
+    
+    # The body is already-encoded bytes, so let Werkzeug send it as is
+    response = Response(body, mimetype='application/json', direct_passthrough=True)
+    response.set_etag(etag)
+    # Like the index page: always revalidate, so a new customer shows up at once
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def parse_new_customer(data):
+    """Validate an /add_customer body; returns (add_customer_to_db args, None) or (None, error message)"""
+    if not isinstance(data, dict):
+        return None, "Request body must be a JSON object"
+    
+    args = []
+    for field in ('name', 'phone', 'address'):
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None, f"{field} is required"
+        args.append(value)
+    
+    for field in ('credit_score', 'pre_approved_limit', 'monthly_salary'):
+        value = _whole_number(data.get(field))
+        if value is None:
+            return None, f"{field} must be a whole number"
+        args.append(value)
+    
+    if not 300 <= args[3] <= 900:
+        return None, "Credit score must be between 300 and 900"
+    
+    # Both amounts go straight into INTEGER columns, which are 64-bit
+    for field, value in (('pre_approved_limit', args[4]), ('monthly_salary', args[5])):
+        if not 0 < value <= SQLITE_MAX_INT:
+            return None, f"{field} must be a positive amount"
+    
+    return args, None
 
 @app.route('/add_customer', methods=['POST'])
 def add_customer():
-    data = request.json
+    args, error = parse_new_customer(request.get_json(silent=True))
+    if error:
+        return _json({"status": "error", "message": error}), 400
     
-    customer_id = add_customer_to_db(
-        data.get('name'),
-        data.get('phone'),
-        data.get('address'),
-        int(data.get('credit_score')),
-        int(data.get('pre_approved_limit')),
-        int(data.get('monthly_salary'))
-    )
+    customer_id = add_customer_to_db(*args)
     
-    return jsonify({
+    return _json({
         "status": "success",
-        "message": f"Customer {data.get('name')} added successfully!",
+        "message": f"Customer {args[0]} added successfully!",
         "customer_id": customer_id
     })
 
+@app.route('/health')
+def health():
+    """Report queue depths so backpressure on the background workers is visible"""
+    return _json({
+        "status": "ok",
+        "write_queue_depth": _WRITE_Q.qsize(),
+        "letter_queue_depth": _LETTER_Q.qsize()
+    })
+
+# Spawned render workers re-import the main script as __mp_main__; only the
+# server process itself opens the database and starts the background threads
+if __name__ != '__mp_main__':
+    for _ in range(POOL_SIZE):
+        _POOL.put(_connect())
+    # Initialize database on startup
+    init_db()
+    threading.Thread(target=_writer_loop, daemon=True).start()
+    threading.Thread(target=_letter_worker, daemon=True).start()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -0,0 +1,104 @@
+"""Sanction letter rendering.
+
+Render workers in the process pool import only this module, so it must not
+touch the database or start threads at import time.
+"""
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+import io
+
+# Letters only use the standard (non-embedded) Helvetica faces
+pdfmetrics.registerFontFamily('Helvetica', normal='Helvetica', bold='Helvetica-Bold', italic='Helvetica-Oblique')
+
+# Sanction letter layout, in points, computed once
+LETTER_WIDTH, LETTER_HEIGHT = letter
+_LM = 1*inch
+_LM_INDENT = 1.2*inch
+_RM = LETTER_WIDTH - 1*inch
+_LEADING = 0.25*inch
+_HEADER_Y = LETTER_HEIGHT - 1*inch
+_SUBHEADER_Y = LETTER_HEIGHT - 1.3*inch
+_RULE_Y = LETTER_HEIGHT - 1.5*inch
+_TITLE_Y = LETTER_HEIGHT - 2*inch
+_DATE_Y = LETTER_HEIGHT - 2.5*inch
+_CUSTOMER_HEADING_Y = LETTER_HEIGHT - 3*inch
+_CUSTOMER_Y = LETTER_HEIGHT - 3.3*inch
+_LOAN_HEADING_Y = LETTER_HEIGHT - 4.3*inch
+_LOAN_Y = LETTER_HEIGHT - 4.6*inch
+_STATUS_Y = LETTER_HEIGHT - 5.85*inch
+_FOOTER_Y = 1*inch
+_FOOTER_CONTACT_Y = 0.75*inch
+
+def draw_letterhead(c):
+    """Draws the parts of the sanction letter that are the same on every copy"""
+    # Add Tata Capital Header
+    c.setFont("Helvetica-Bold", 20)
+    c.drawString(_LM, _HEADER_Y, "TATA CAPITAL")
+    
+    c.setFont("Helvetica", 10)
+    c.drawString(_LM, _SUBHEADER_Y, "Financial Services Limited")
+    c.line(_LM, _RULE_Y, _RM, _RULE_Y)
+    
+    # Title
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(_LM, _TITLE_Y, "LOAN SANCTION LETTER")
+    
+    # Section headings
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(_LM, _CUSTOMER_HEADING_Y, "Customer Details:")
+    c.drawString(_LM, _LOAN_HEADING_Y, "Loan Details:")
+    
+    # Footer
+    c.setFont("Helvetica-Oblique", 9)
+    c.drawString(_LM, _FOOTER_Y, "This is a system-generated letter. No signature is required.")
+    c.drawString(_LM, _FOOTER_CONTACT_Y, "For queries, contact: support@tatacapital.com | 1800-123-4567")
+
+def render_sanction_letter(task):
+    """Renders the PDF described by a letter task and returns its bytes; touches neither the DB nor app state"""
+    # Create PDF in memory; the caller decides where the bytes go
+    buf = io.BytesIO()
+    # Compressed streams keep letters small; invariant output keeps identical letters byte-identical
+    c = canvas.Canvas(buf, pagesize=letter, pageCompression=1, invariant=1)
+    draw_letterhead(c)
+    
+    # Date
+    c.setFont("Helvetica", 11)
+    c.drawString(_LM, _DATE_Y, f"Date: {task['issue_date'].strftime('%d %B, %Y')}")
+    
+    emi = task["emi"]
+    if emi is None:
+        total_payable = task["loan_amount"] * (1 + task["interest_rate"]/100)
+        emi = total_payable / task["tenure_months"]
+    
+    # Customer and loan details go out as a single text object
+    text = c.beginText(_LM_INDENT, _CUSTOMER_Y)
+    text.setFont("Helvetica", 11, leading=_LEADING)
+    text.textLines([
+        f"Name: {task['name']}",
+        f"Phone: {task['phone']}",
+        f"Address: {task['address']}",
+    ])
+    text.setTextOrigin(_LM_INDENT, _LOAN_Y)
+    text.textLines([
+        f"Loan Amount: Rs {task['loan_amount']:,}",
+        f"Interest Rate: {task['interest_rate']}% per annum",
+        f"Tenure: {task['tenure_months']} months",
+        f"Estimated EMI: Rs {emi:,.2f}",
+    ])
+    c.drawText(text)
+    
+    # Approval Status
+    c.setFont("Helvetica-Bold", 14)
+    if task["approval_status"] == "approved":
+        c.setFillColorRGB(0, 0.5, 0)
+        c.drawString(_LM, _STATUS_Y, "STATUS: APPROVED")
+    else:
+        c.setFillColorRGB(0.8, 0, 0)
+        c.drawString(_LM, _STATUS_Y, f"STATUS: {task['approval_status'].upper()}")
+    
+    # IMPORTANT: Save the PDF
+    c.save()
+    
+    return buf.getvalue()